@@ -0,0 +1,232 @@
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+# A row is identified by the interface it was found on and the EPG it belongs to
+KEY_COLS = ['Node', 'Interface', 'DN']
+# Columns compared between the two runs
+VALUE_COLS = ['VLAN', 'PathType', 'PathDN', 'Domains']
+NAME_COLS = ['Tenant', 'AppProfile', 'EPG']
+WANTED_COLS = set(NAME_COLS + VALUE_COLS + KEY_COLS)
+
+OUTPUT_FORMATS = ('xlsx', 'csv', 'parquet')
+# An Excel sheet holds 1,048,576 rows, one of them is the header
+XLSX_MAX_ROWS = 1048575
+# Rows read at a time when splitting a CSV or Parquet run into partitions
+CHUNK_ROWS = 200000
+# Input bytes per partition, each partition is diffed in memory on its own
+PARTITION_BYTES = 64 * 1024 * 1024
+
+def has_parquet_engine():
+    return bool(importlib.util.find_spec('pyarrow') or importlib.util.find_spec('fastparquet'))
+
+def output_format(output_file):
+    return os.path.splitext(output_file)[1].lstrip('.').lower()
+
+def _read_whole(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return pd.read_csv(path, dtype=str, keep_default_na=False, usecols=lambda c: c in WANTED_COLS)
+    if ext == '.parquet':
+        df = pd.read_parquet(path)
+        # Missing values must read as '' like the CSV/Excel loads, not 'nan'/'None'
+        return df[[c for c in df.columns if c in WANTED_COLS]].fillna('').astype(str)
+    return pd.read_excel(path, dtype=str, keep_default_na=False, usecols=lambda c: c in WANTED_COLS)
+
+def _read_chunks(path, chunksize):
+    """Yields a run in pieces of at most `chunksize` rows. Excel files cannot be read in pieces and come whole."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        yield from pd.read_csv(path, dtype=str, keep_default_na=False, usecols=lambda c: c in WANTED_COLS,
+                               chunksize=chunksize)
+    elif ext == '.parquet' and importlib.util.find_spec('pyarrow'):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        columns = [c for c in parquet.schema_arrow.names if c in WANTED_COLS]
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas().fillna('').astype(str)
+    else:
+        yield _read_whole(path)
+
+def _normalize(df):
+    for col in NAME_COLS + VALUE_COLS + ['Node', 'Interface']:
+        if col not in df.columns:
+            df[col] = ""
+    df['Node'] = df['Node'].str.strip()
+    df['Interface'] = df['Interface'].str.strip()
+
+    # Older outputs do not carry the EPG DN, rebuild it from the name columns
+    if 'DN' not in df.columns:
+        df['DN'] = "uni/tn-" + df['Tenant'] + "/ap-" + df['AppProfile'] + "/epg-" + df['EPG']
+
+    return df[KEY_COLS + NAME_COLS + VALUE_COLS]
+
+def load_run(path):
+    """
+    Loads a discovery output (.xlsx, .csv or .parquet) with only the columns the diff needs.
+    All columns are read as strings so '225' and 225 compare equal between runs.
+    """
+    return _normalize(_read_whole(path))
+
+def diff_runs(before, after):
+    """
+    Compares two discovery runs keyed on (Node, Interface, EPG DN).
+    Returns a DataFrame with one row per added, removed or changed EPG binding.
+    Both runs and the joined frame are held in memory, use diff_files for large runs.
+    """
+    # Hash the three key columns into one 64-bit key, joining on integers is much
+    # faster than factorizing three string columns on both sides
+    before = before.assign(_key=pd.util.hash_pandas_object(before[KEY_COLS], index=False).to_numpy())
+    after = after.assign(_key=pd.util.hash_pandas_object(after[KEY_COLS], index=False).to_numpy())
+
+    # Duplicate keys (e.g. the same interface listed twice in the input) would multiply the join
+    before = before.drop_duplicates(subset='_key')
+    after = after.drop_duplicates(subset='_key')
+
+    # Hash join on the key, the string key columns ride along from both sides
+    merged = pd.merge(
+        before, after.drop(columns=KEY_COLS),
+        on='_key', how='outer', suffixes=('_before', '_after'), indicator=True,
+    )
+    # Rows only present in the later run take their key columns from that side
+    added = (merged['_merge'] == 'right_only').to_numpy()
+    if added.any():
+        key_lookup = after.set_index('_key')[KEY_COLS]
+        merged.loc[added, KEY_COLS] = key_lookup.loc[merged.loc[added, '_key']].to_numpy()
+
+    both = (merged['_merge'] == 'both').to_numpy()
+    # One boolean column per compared field, only the few changed rows are turned into strings later
+    differs = pd.DataFrame({col: both & (merged[f"{col}_before"] != merged[f"{col}_after"]).to_numpy()
+                            for col in VALUE_COLS}, index=merged.index)
+
+    change = pd.Series("", index=merged.index)
+    change[added] = "Added"
+    change[(merged['_merge'] == 'left_only').to_numpy()] = "Removed"
+    change[differs.any(axis=1)] = "Changed"
+
+    keep = change != ""
+    merged = merged[keep]
+    differs = differs[keep]
+
+    result = merged[KEY_COLS].copy()
+    result.insert(0, 'Change', change[keep])
+    # Take the EPG names from whichever side has the row
+    for col in NAME_COLS:
+        result[col] = merged[f"{col}_after"].fillna(merged[f"{col}_before"])
+    result['ChangedFields'] = [", ".join(c for c, d in zip(VALUE_COLS, row) if d)
+                               for row in differs.itertuples(index=False)]
+    for col in VALUE_COLS:
+        result[f"{col}_before"] = merged[f"{col}_before"]
+        result[f"{col}_after"] = merged[f"{col}_after"]
+
+    return result.sort_values(['Change'] + KEY_COLS).reset_index(drop=True)
+
+def _partition(path, directory, side, partitions, chunksize):
+    """Splits a run into `partitions` buckets by the hash of its key columns, one pickle per chunk and bucket."""
+    for n, chunk in enumerate(_read_chunks(path, chunksize)):
+        chunk = _normalize(chunk)
+        buckets = pd.util.hash_pandas_object(chunk[KEY_COLS], index=False).to_numpy() % partitions
+        for bucket, part in chunk.groupby(buckets, sort=False):
+            part.to_pickle(os.path.join(directory, f"{side}-{bucket}-{n}.pkl"))
+
+def _load_bucket(directory, side, bucket):
+    prefix = f"{side}-{bucket}-"
+    names = [name for name in os.listdir(directory) if name.startswith(prefix)]
+    # In chunk order, so duplicate keys keep their first row like diff_runs does
+    names.sort(key=lambda name: int(name[len(prefix):-len(".pkl")]))
+    parts = [pd.read_pickle(os.path.join(directory, name)) for name in names]
+    if not parts:
+        return pd.DataFrame(columns=KEY_COLS + NAME_COLS + VALUE_COLS, dtype=str)
+    return pd.concat(parts, ignore_index=True)
+
+def diff_files(before_file, after_file, partitions=None, chunksize=CHUNK_ROWS):
+    """
+    Compares two run files like diff_runs without holding both runs in memory.
+    The rows of each run are split by the hash of their key into `partitions`
+    temporary files (one per PARTITION_BYTES of input by default), then each pair
+    of partitions is diffed on its own. A key lands in the same partition on both
+    sides, so the result is the same as diffing the whole runs, while memory is
+    bounded by one chunk or one partition pair plus the differences found.
+    """
+    if partitions is None:
+        size = os.path.getsize(before_file) + os.path.getsize(after_file)
+        partitions = max(1, -(-size // PARTITION_BYTES))
+    if partitions == 1:
+        return diff_runs(load_run(before_file), load_run(after_file))
+
+    diffs = []
+    with tempfile.TemporaryDirectory(prefix='aci_epg_diff-') as directory:
+        _partition(before_file, directory, 'before', partitions, chunksize)
+        _partition(after_file, directory, 'after', partitions, chunksize)
+        for bucket in range(partitions):
+            diff = diff_runs(_load_bucket(directory, 'before', bucket), _load_bucket(directory, 'after', bucket))
+            if len(diff):
+                diffs.append(diff)
+    if not diffs:
+        return diff
+    return pd.concat(diffs, ignore_index=True).sort_values(['Change'] + KEY_COLS).reset_index(drop=True)
+
+def check_diff_output(output_file):
+    """Returns why the diff cannot be written to `output_file`, or None. Checked before any file is read."""
+    fmt = output_format(output_file)
+    if fmt not in OUTPUT_FORMATS:
+        return f"cannot write .{fmt or '(no extension)'} files, use .xlsx, .csv or .parquet"
+    if fmt == 'parquet' and not has_parquet_engine():
+        return "parquet output needs pyarrow or fastparquet installed"
+    return None
+
+def save_diff(diff, output_file):
+    """Writes the diff as .xlsx, .csv or .parquet depending on the file extension."""
+    fmt = output_format(output_file)
+    if fmt == 'xlsx' and len(diff) > XLSX_MAX_ROWS:
+        raise ValueError(f"{len(diff)} differences do not fit in an Excel sheet ({XLSX_MAX_ROWS} rows), "
+                         "write .csv or .parquet instead")
+    if fmt == 'csv':
+        diff.to_csv(output_file, index=False)
+    elif fmt == 'parquet':
+        diff.to_parquet(output_file, index=False)
+    else:
+        diff.to_excel(output_file, index=False)
+
+def print_diff_summary(diff):
+    counts = diff['Change'].value_counts()
+    print("\nDiff summary:")
+    for change in ("Added", "Removed", "Changed"):
+        print(f"  {change + ':':<9}{counts.get(change, 0)}")
+
+def run_diff(before_file, after_file, output_file):
+    diff = diff_files(before_file, after_file)
+    print_diff_summary(diff)
+    if len(diff):
+        try:
+            save_diff(diff, output_file)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+        print(f"Differences saved to {output_file}")
+    else:
+        print("No differences found.")
+    return 0
+
+def add_diff_arguments(parser):
+    """Adds the diff options, shared by this script and the `diff` subcommand of aci_epg_discovery."""
+    parser.add_argument('before', help="Output of the earlier run (.xlsx, .csv or .parquet)")
+    parser.add_argument('after', help="Output of the later run (.xlsx, .csv or .parquet)")
+    parser.add_argument('-o', '--output', default='diff_epgs.xlsx', help="Where to write the differences (.xlsx, .csv or .parquet)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two ACI EPG discovery runs.")
+    add_diff_arguments(parser)
+    args = parser.parse_args()
+
+    error = check_diff_output(args.output)
+    if error:
+        parser.error(f"--output {args.output}: {error}")
+    return run_diff(args.before, args.after, args.output)
+
+if __name__ == "__main__":
+    sys.exit(main())
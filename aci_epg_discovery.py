@@ -2,15 +2,155 @@ import requests
 import pandas as pd
 import xml.etree.ElementTree as ET
 import urllib3
+import argparse
 import getpass
+import json
+import multiprocessing
 import os
+import random
+import re
+import sys
+import threading
 import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import aci_epg_diff
 
 # Disable warnings for self-signed certificates
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def login_apic(apic_ip, username, password):
-    """Logs into the APIC and returns the session cookie."""
+# Shared lock for the run statistics counters (retries, re-logins, breaker trips)
+_stats_lock = threading.Lock()
+
+def _bump(stats, key, amount=1):
+    """Increments a run statistics counter."""
+    if stats is None:
+        return
+    with _stats_lock:
+        stats[key] += amount
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker has given up on the APIC."""
+
+class RetryPolicy:
+    """
+    Retry and timeout settings for APIC calls.
+    Backoff is exponential (backoff_base * 2^attempt, capped at backoff_max)
+    with up to `jitter` (as a fraction) of random spread added on top.
+    """
+    # Status codes that mean "try again later" rather than "this request is wrong"
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_max=8.0, jitter=0.5,
+                 connect_timeout=3.05, read_timeout=30):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    @property
+    def timeout(self):
+        # requests accepts a (connect, read) tuple
+        return (self.connect_timeout, self.read_timeout)
+
+    def backoff(self, attempt):
+        """Returns the delay in seconds before retry number `attempt` (0-based)."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay + random.uniform(0, delay * self.jitter)
+
+class CircuitBreaker:
+    """
+    Pauses all callers when the APIC looks overloaded.
+    After `failure_threshold` consecutive failures the breaker opens and every
+    request waits `cooldown` seconds. Then it is half-open: one request goes out
+    as a probe while the others wait. If the probe succeeds the breaker closes and
+    the trip count is cleared, if it fails the breaker opens again. While it has
+    tripped more than `max_trips` times in a row requests fail fast instead of waiting.
+    With fail_fast=True callers never wait: they get CircuitOpenError right away,
+    which lets an ApicCluster fail over to another member.
+    """
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_trips=5, stats=None, fail_fast=False):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+        self.stats = stats
+        self.fail_fast = fail_fast
+        self.failures = 0
+        self.trips = 0
+        self.tripped = False
+        self.open_until = 0.0
+        # (thread id, deadline) of the half-open probe in flight
+        self._probe = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Blocks while the breaker is open or another caller is probing. Raises CircuitOpenError when failing fast."""
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self.tripped:
+                    return
+                now = time.monotonic()
+                if now >= self.open_until and (self._probe is None or self._probe[0] == me or now >= self._probe[1]):
+                    # Half-open: this caller is the probe. A probe that never reports back expires after a cooldown
+                    self._probe = (me, now + self.cooldown)
+                    return
+                if self.trips > self.max_trips or self.fail_fast:
+                    raise CircuitOpenError(f"APIC unavailable (circuit breaker tripped {self.trips} times)")
+                if now < self.open_until:
+                    delay = self.open_until - now
+                else:
+                    delay = min(self._probe[1] - now, 0.5)
+            time.sleep(delay)
+
+    def is_open(self):
+        with self._lock:
+            return self.tripped and time.monotonic() < self.open_until
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.trips = 0
+            self.tripped = False
+            self.open_until = 0.0
+            self._probe = None
+
+    def record_success(self):
+        with self._lock:
+            recovered = self.tripped
+            self.failures = 0
+            self.trips = 0
+            self.tripped = False
+            self._probe = None
+        if recovered:
+            print("  APIC is answering again, resuming requests")
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.tripped:
+                # Only the probe's failure re-opens the breaker, not requests already in flight when it opened
+                if self._probe is None or self._probe[0] != threading.get_ident():
+                    return
+            else:
+                self.failures += 1
+                if self.failures < self.failure_threshold:
+                    return
+                self.failures = 0
+                self.tripped = True
+            self.trips += 1
+            self.open_until = now + self.cooldown
+            self._probe = None
+            trips = self.trips
+        _bump(self.stats, 'breaker_trips')
+        print(f"  APIC appears overloaded, pausing requests for {self.cooldown}s (trip {trips})")
+
+def login_apic(apic_ip, username, password, policy=None, stats=None):
+    """Logs into the APIC and returns the session cookie. Transient failures are retried per `policy`."""
+    policy = policy or RetryPolicy()
     url = f"https://{apic_ip}/api/aaaLogin.json"
     payload = {
         "aaaUser": {
@@ -20,30 +160,324 @@ def login_apic(apic_ip, username, password):
             }
         }
     }
-    try:
-        response = requests.post(url, json=payload, verify=False, timeout=10)
-        response.raise_for_status()
-        token = response.json()['imdata'][0]['aaaLogin']['attributes']['token']
-        return token
-    except Exception as e:
-        print(f"Login failed: {e}")
-        return None
+    attempt = 0
+    while True:
+        try:
+            response = requests.post(url, json=payload, verify=False, timeout=policy.timeout)
+            if response.status_code not in policy.RETRY_STATUS_CODES:
+                response.raise_for_status()
+                token = response.json()['imdata'][0]['aaaLogin']['attributes']['token']
+                return token
+            error = requests.HTTPError(f"{response.status_code} Error for url: {url}", response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        except Exception as e:
+            print(f"Login failed: {e}")
+            return None
+
+        if attempt >= policy.max_retries:
+            print(f"Login failed: {error}")
+            return None
+        delay = policy.backoff(attempt)
+        attempt += 1
+        _bump(stats, 'retries')
+        print(f"  Login retry {attempt}/{policy.max_retries} in {delay:.1f}s: {error}")
+        time.sleep(delay)
+
+class ApicSession:
+    """
+    A logged-in APIC with retries, re-login on token expiry (403) and a circuit breaker.
+    Query helpers call get() with the API path (e.g. "/api/node/mo/uni.json").
+    """
+    def __init__(self, apic_ip, username, password, policy=None, breaker=None, stats=None):
+        self.apic_ip = apic_ip
+        self.username = username
+        self.password = password
+        self.stats = stats if stats is not None else Counter()
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(stats=self.stats)
+        self.token = None
+        self._login_lock = threading.Lock()
+
+    def login(self):
+        self.token = login_apic(self.apic_ip, self.username, self.password, self.policy, self.stats)
+        return self.token
+
+    def _relogin(self, stale_token):
+        # Only the first caller to see the expired token logs in again
+        with self._login_lock:
+            if self.token == stale_token:
+                print(f"  Token expired on {self.apic_ip}, logging in again...")
+                _bump(self.stats, 'relogins')
+                self.login()
+
+    def get(self, path):
+        """GETs `path` from the APIC, retrying transient failures. Returns the response."""
+        url = f"https://{self.apic_ip}{path}"
+        attempt = 0
+        relogged = False
+        while True:
+            self.breaker.before_request()
+            token = self.token
+            headers = {
+                "Cookie": f"APIC-cookie={token}"
+            }
+            try:
+                response = requests.get(url, headers=headers, verify=False, timeout=self.policy.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record_failure()
+                error = e
+            else:
+                if response.status_code == 403 and not relogged:
+                    # APIC answers 403 when the token has expired
+                    self._relogin(token)
+                    relogged = True
+                    continue
+                if response.status_code in self.policy.RETRY_STATUS_CODES:
+                    self.breaker.record_failure()
+                    error = requests.HTTPError(f"{response.status_code} Error for url: {url}", response=response)
+                else:
+                    self.breaker.record_success()
+                    response.raise_for_status()
+                    return response
+
+            if attempt >= self.policy.max_retries:
+                _bump(self.stats, 'failed_requests')
+                raise error
+            delay = self.policy.backoff(attempt)
+            attempt += 1
+            _bump(self.stats, 'retries')
+            print(f"  Retry {attempt}/{self.policy.max_retries} in {delay:.1f}s: {error}")
+            time.sleep(delay)
+
+class ApicCluster:
+    """
+    Spreads read queries across the APICs of one cluster.
+    Each query goes to the member with the lowest (outstanding requests + 1) * latency,
+    so idle and fast controllers are preferred. Members that fail or are much slower
+    than the others are dropped from rotation for `down_time` seconds and then
+    health-checked before they are used again.
+    """
+    # Cheap read used to health-check a controller
+    HEALTH_CHECK_PATH = '/api/node/class/topSystem.json?query-target-filter=eq(topSystem.role,"controller")'
+
+    def __init__(self, members, slow_factor=3.0, min_slow_latency=2.0, down_time=60.0, stats=None):
+        self.members = list(members)
+        self.slow_factor = slow_factor
+        self.min_slow_latency = min_slow_latency
+        self.down_time = down_time
+        self.stats = stats if stats is not None else Counter()
+        self._outstanding = {m.apic_ip: 0 for m in self.members}
+        self._latency = {m.apic_ip: None for m in self.members}
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_ips(cls, apic_ips, username, password, policy=None, stats=None):
+        stats = stats if stats is not None else Counter()
+        # With more than one member an open breaker should fail over, not wait out the cooldown
+        fail_fast = len(apic_ips) > 1
+        members = [ApicSession(ip, username, password, policy=policy, stats=stats,
+                               breaker=CircuitBreaker(stats=stats, fail_fast=fail_fast))
+                   for ip in apic_ips]
+        return cls(members, stats=stats)
+
+    def login(self):
+        """Logs into every member. Returns True if at least one login worked."""
+        for member in self.members:
+            if not member.login():
+                print(f"  Login to {member.apic_ip} failed, leaving it out of rotation.")
+                self._mark_down(member, "login failed")
+        return any(m.token for m in self.members)
+
+    def _mark_down(self, member, reason):
+        now = time.monotonic()
+        with self._lock:
+            in_rotation = [m for m in self.members
+                           if m is not member and self._down_until.get(m.apic_ip, 0) <= now]
+            if not in_rotation and member.token:
+                # Never drop the last usable member; its own retries and breaker still apply
+                return
+            self._down_until[member.apic_ip] = now + self.down_time
+        _bump(self.stats, 'members_dropped')
+        print(f"  Dropping APIC {member.apic_ip} from rotation for {self.down_time}s ({reason})")
+
+    def _revive_due_members(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [m for m in self.members if 0 < self._down_until.get(m.apic_ip, 0) <= now]
+            for member in due:
+                # Push the deadline out so other threads do not probe the same member
+                self._down_until[member.apic_ip] = now + self.down_time
+        for member in due:
+            self.health_check(member)
+
+    def health_check(self, member):
+        """Probes one member and puts it back into rotation if it answers. Returns True if healthy."""
+        try:
+            if not member.token and not member.login():
+                return False
+            relogged = False
+            while True:
+                start = time.monotonic()
+                response = requests.get(f"https://{member.apic_ip}{self.HEALTH_CHECK_PATH}",
+                                        headers={"Cookie": f"APIC-cookie={member.token}"},
+                                        verify=False, timeout=member.policy.timeout)
+                # One re-login per probe for an expired token; a second 403 fails the check
+                if response.status_code == 403 and not relogged and member.login():
+                    relogged = True
+                    continue
+                break
+            response.raise_for_status()
+        except Exception as e:
+            print(f"  Health check of {member.apic_ip} failed: {e}")
+            return False
+        member.breaker.reset()
+        with self._lock:
+            self._down_until.pop(member.apic_ip, None)
+            self._latency[member.apic_ip] = time.monotonic() - start
+        print(f"  APIC {member.apic_ip} is healthy again, back in rotation.")
+        return True
+
+    def _pick(self, exclude):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [m for m in self.members
+                          if m.apic_ip not in exclude and self._down_until.get(m.apic_ip, 0) <= now]
+            # Prefer members whose breaker is closed
+            closed = [m for m in candidates if not m.breaker.is_open()]
+            candidates = closed or candidates
+            if not candidates:
+                return None
+            # Unmeasured members count as an average one, so least-outstanding still spreads the first requests
+            known = sorted(v for v in self._latency.values() if v is not None)
+            default_latency = known[len(known) // 2] if known else 1.0
+
+            def score(m):
+                latency = self._latency[m.apic_ip]
+                return (self._outstanding[m.apic_ip] + 1) * (default_latency if latency is None else latency)
+            member = min(candidates, key=score)
+            self._outstanding[member.apic_ip] += 1
+            return member
+
+    def _record_latency(self, member, latency):
+        with self._lock:
+            self._outstanding[member.apic_ip] -= 1
+            previous = self._latency[member.apic_ip]
+            # Exponentially weighted moving average of the response time
+            current = latency if previous is None else 0.8 * previous + 0.2 * latency
+            self._latency[member.apic_ip] = current
+            others = [v for ip, v in self._latency.items()
+                      if ip != member.apic_ip and v is not None and self._down_until.get(ip, 0) <= time.monotonic()]
+        if others and current > self.min_slow_latency and current > self.slow_factor * min(others):
+            self._mark_down(member, f"slow, {current:.1f}s average response")
 
-def get_epgs_for_interface(apic_ip, token, node, interface):
-    """Queries the APIC for EPGs on a specific interface."""
+    def get(self, path):
+        """GETs `path` from the best available member, failing over to the others on error."""
+        self._revive_due_members()
+        tried = set()
+        last_error = None
+        while True:
+            member = self._pick(tried)
+            if member is None:
+                if last_error is None:
+                    raise CircuitOpenError("No APIC cluster member available")
+                raise last_error
+            start = time.monotonic()
+            try:
+                response = member.get(path)
+            except requests.HTTPError as e:
+                with self._lock:
+                    self._outstanding[member.apic_ip] -= 1
+                status = e.response.status_code if e.response is not None else None
+                if status is not None and status not in member.policy.RETRY_STATUS_CODES:
+                    # The request itself is bad, another member will give the same answer
+                    raise
+                last_error = e
+            except Exception as e:
+                with self._lock:
+                    self._outstanding[member.apic_ip] -= 1
+                last_error = e
+            else:
+                self._record_latency(member, time.monotonic() - start)
+                return response
+
+            tried.add(member.apic_ip)
+            self._mark_down(member, str(last_error))
+            if len(tried) < len(self.members):
+                _bump(self.stats, 'failovers')
+
+class _CachedReply:
+    """The parts of a requests.Response the query helpers use, rebuilt from the cached body."""
+    def __init__(self, content):
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+class CachedApic:
+    """
+    Remembers EPG and EPP replies by API path for the length of a run.
+    Many interfaces carry the same EPGs, so those queries are only sent once. Only the
+    reply body is kept, and per-interface queries (never repeated) are not cached.
+    Concurrent callers asking for the same path wait for the one request in flight.
+    At most `max_entries` replies are kept, the least recently used one is dropped first.
+    """
+    # EPG (uni/tn-...) and EPP (uni/epp/...) paths; interface queries live under topology/
+    CACHED_PREFIX = "/api/node/mo/uni/"
+
+    def __init__(self, apic, max_entries=4096):
+        self.apic = apic
+        self.stats = apic.stats
+        self.max_entries = max_entries
+        self._replies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        if not path.startswith(self.CACHED_PREFIX):
+            return self.apic.get(path)
+
+        with self._lock:
+            entry = self._replies.get(path)
+            owner = entry is None
+            if owner:
+                entry = self._replies[path] = Future()
+                while len(self._replies) > self.max_entries:
+                    self._replies.popitem(last=False)
+            else:
+                self._replies.move_to_end(path)
+        if not owner:
+            # Raises the owner's error if its request failed, that is not a hit
+            content = entry.result()
+            _bump(self.stats, 'cache_hits')
+            return _CachedReply(content)
+
+        try:
+            content = self.apic.get(path).content
+        except Exception as e:
+            # Failures are not cached, the next caller tries again
+            with self._lock:
+                if self._replies.get(path) is entry:
+                    del self._replies[path]
+            entry.set_exception(e)
+            raise
+        entry.set_result(content)
+        return _CachedReply(content)
+
+def get_epgs_for_interface(apic, node, interface, raw=False):
+    """Queries the APIC for EPGs on a specific interface. Returns the XML (as bytes if raw=True)."""
     # Format interface for URL (e.g., eth1/10 -> eth1/10, but in URL it is usually eth1/10 inside brackets)
     # The user example: sys/phys-[eth1/43]
     
-    url = f"https://{apic_ip}/api/node/mo/topology/pod-1/node-{node}/sys/phys-[{interface}].xml?rsp-subtree-include=full-deployment&target-node=all&target-path=l1EthIfToEPg"
-    
-    headers = {
-        "Cookie": f"APIC-cookie={token}"
-    }
+    path = f"/api/node/mo/topology/pod-1/node-{node}/sys/phys-[{interface}].xml?rsp-subtree-include=full-deployment&target-node=all&target-path=l1EthIfToEPg"
     
     try:
-        response = requests.get(url, headers=headers, verify=False, timeout=10)
-        response.raise_for_status()
-        return response.text
+        response = apic.get(path)
+        return response.content if raw else response.text
     except Exception as e:
         print(f"Error querying Node {node} Interface {interface}: {e}")
         return None
@@ -85,279 +519,520 @@ def parse_epgs(xml_content):
 
 
 
-def get_epg_vlan(apic_ip, token, epg_dn, node, interface):
-    """
-    Queries the EPG for its fvRsPathAtt children and finds the VLAN for the given node/interface.
-    Returns (vlan, path_type, path_dn, domains_str)
-    """
+# path_type returned by match_epg_vlan() when the EPG is only in a VMM domain
+# and the dynamic VLAN has to be read from the Endpoint Policy (EPP)
+EPP_LOOKUP = "EPP Lookup"
+
+def _epg_paths_path(epg_dn):
     # Query for both static paths (fvRsPathAtt) and VMM domains (fvRsDomAtt) using JSON
     # Explicitly ask for these classes and increase page size to ensure we get all paths
-    url = f"https://{apic_ip}/api/node/mo/{epg_dn}.json?query-target=children&target-subtree-class=fvRsPathAtt,fvRsDomAtt&page-size=10000"
-    headers = {
-        "Cookie": f"APIC-cookie={token}"
-    }
-    
-    try:
-        response = requests.get(url, headers=headers, verify=False, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract Domains
-        domains = []
-        # JSON structure: {"imdata": [{"fvRsDomAtt": {"attributes": {...}}}, ...]}
-        for item in data.get('imdata', []):
-            if 'fvRsDomAtt' in item:
-                t_dn = item['fvRsDomAtt']['attributes'].get('tDn')
-                if t_dn:
-                    parts = t_dn.split('/')
-                    if parts:
-                        last_part = parts[-1]
-                        if '-' in last_part:
-                            domains.append(last_part.split('-', 1)[1])
-                        else:
-                            domains.append(last_part)
-        domains_str = ", ".join(domains)
-
-        # 1. Check for Static Paths (fvRsPathAtt)
-        # Normalize interface: ensure 'eth' prefix, remove 'Ethernet' if present, STRIP whitespace
-        clean_interface = str(interface).strip()
-        norm_interface = clean_interface.replace("Ethernet", "eth")
-        target_direct_suffix = f"pathep-[{norm_interface}]"
-        
-        partial_matches = []
+    return f"/api/node/mo/{epg_dn}.json?query-target=children&target-subtree-class=fvRsPathAtt,fvRsDomAtt&page-size=10000"
 
-        for item in data.get('imdata', []):
-            if 'fvRsPathAtt' in item:
-                attrs = item['fvRsPathAtt']['attributes']
-                t_dn = attrs.get('tDn')
-                encap = attrs.get('encap')
-                
-                if not t_dn:
-                    continue
-                
-                # Check for Direct Match (or Exact VPC Match if user provided Policy Group name)
-                # We check if the tDn contains the target suffix (pathep-[interface])
-                # AND if the Node ID is correct.
-                
-                if target_direct_suffix in t_dn:
-                    # Check Node for Direct Path
-                    if f"paths-{node}/" in t_dn:
-                        return encap, "Direct", t_dn, domains_str
-                    
-                    # Check Node for VPC Path
-                    if "protpaths-" in t_dn:
-                        try:
-                            parts = t_dn.split('/')
-                            for part in parts:
-                                if part.startswith('protpaths-'):
-                                    nodes_str = part[10:] # 225-226
-                                    vpc_nodes = nodes_str.split('-')
-                                    if str(node) in vpc_nodes:
-                                        return encap, "VPC", t_dn, domains_str
-                        except Exception:
-                            pass
-                
-                # Heuristic VPC Match: Check if Port Number matches
-                # If the user asks for 'eth1/10' and the path is '..._PolGrp_Port10', strict match fails.
-                # We check if the port number (10) appears as a distinct number in the path suffix.
+def _epp_conn_path(epg_dn, node):
+    # Optimized: Query fvIfConn directly under the Node.
+    # This avoids traversing the hierarchy and potential missing children issues.
+    return f"/api/node/mo/uni/epp/fv-[{epg_dn}]/node-{node}.json?query-target=subtree&target-subtree-class=fvIfConn"
+
+def match_epg_vlan(data, node, interface):
+    """
+    Finds the VLAN for the given node/interface in the fvRsPathAtt/fvRsDomAtt children of an EPG.
+    Returns (vlan, path_type, path_dn, domains_str). path_type is EPP_LOOKUP when the EPG
+    is in a VMM domain without a static path, the caller then resolves it with match_dynamic_vlan().
+    Pure function (no APIC calls) so it can run in a worker process.
+    """
+    # Extract Domains
+    domains = []
+    # JSON structure: {"imdata": [{"fvRsDomAtt": {"attributes": {...}}}, ...]}
+    for item in data.get('imdata', []):
+        if 'fvRsDomAtt' in item:
+            t_dn = item['fvRsDomAtt']['attributes'].get('tDn')
+            if t_dn:
+                parts = t_dn.split('/')
+                if parts:
+                    last_part = parts[-1]
+                    if '-' in last_part:
+                        domains.append(last_part.split('-', 1)[1])
+                    else:
+                        domains.append(last_part)
+    domains_str = ", ".join(domains)
+
+    # 1. Check for Static Paths (fvRsPathAtt)
+    # Normalize interface: ensure 'eth' prefix, remove 'Ethernet' if present, STRIP whitespace
+    clean_interface = str(interface).strip()
+    norm_interface = clean_interface.replace("Ethernet", "eth")
+    target_direct_suffix = f"pathep-[{norm_interface}]"
+
+    partial_matches = []
+
+    for item in data.get('imdata', []):
+        if 'fvRsPathAtt' in item:
+            attrs = item['fvRsPathAtt']['attributes']
+            t_dn = attrs.get('tDn')
+            encap = attrs.get('encap')
+
+            if not t_dn:
+                continue
+
+            # Check for Direct Match (or Exact VPC Match if user provided Policy Group name)
+            # We check if the tDn contains the target suffix (pathep-[interface])
+            # AND if the Node ID is correct.
+
+            if target_direct_suffix in t_dn:
+                # Check Node for Direct Path
+                if f"paths-{node}/" in t_dn:
+                    return encap, "Direct", t_dn, domains_str
+
+                # Check Node for VPC Path
                 if "protpaths-" in t_dn:
                     try:
-                        # 1. Verify Node ID matches VPC
-                        node_match = False
                         parts = t_dn.split('/')
                         for part in parts:
                             if part.startswith('protpaths-'):
-                                nodes_str = part[10:]
+                                nodes_str = part[10:] # 225-226
                                 vpc_nodes = nodes_str.split('-')
                                 if str(node) in vpc_nodes:
-                                    node_match = True
-                                    break
-                        
-                        if node_match:
-                            # 2. Extract Port Number from Input
-                            # input: eth1/10 -> 10
-                            import re
-                            port_num = None
-                            match = re.search(r'(\d+)$', clean_interface)
-                            if match:
-                                port_num = match.group(1)
-                            
-                            if port_num:
-                                # 3. Extract all numbers from the Path Suffix (inside pathep-[...])
-                                # tDn: .../pathep-[Leaf-225-226_PolGrp_Port10]
-                                suffix_match = re.search(r'pathep-\[(.*?)\]', t_dn)
-                                if suffix_match:
-                                    suffix_content = suffix_match.group(1)
-                                    # Find all distinct numbers in the suffix
-                                    path_numbers = re.findall(r'\d+', suffix_content)
-                                    
-                                    # 4. Check if port_num is in path_numbers
-                                    # We compare strings: "10" in ["225", "226", "10"] -> True
-                                    if port_num in path_numbers:
-                                        return encap, "VPC", t_dn, domains_str
+                                    return encap, "VPC", t_dn, domains_str
                     except Exception:
                         pass
-                
-                # Check for Partial Match (Interface matches, but Node doesn't)
-                if target_direct_suffix in t_dn:
-                    # Extract the node from the path to show the user
-                    found_node = "Unknown"
-                    if "paths-" in t_dn:
-                        # .../paths-227/...
-                        try:
-                            found_node = t_dn.split('paths-')[1].split('/')[0]
-                        except: pass
-                    elif "protpaths-" in t_dn:
-                        # .../protpaths-225-226/...
-                        try:
-                            found_node = t_dn.split('protpaths-')[1].split('/')[0]
-                        except: pass
-                    
-                    partial_matches.append(f"Node {found_node}")
-
-        # 2. If no static path matched, check if it's a VMM Domain
-        is_vmm = False
-        for item in data.get('imdata', []):
-            if 'fvRsDomAtt' in item:
-                t_dn = item['fvRsDomAtt']['attributes'].get('tDn', '')
-                if 'vmmp-' in t_dn:
-                    is_vmm = True
-                    break
-        
-        if is_vmm:
-            # Attempt to resolve Dynamic VLAN via Endpoint Policy (EPP)
-            # Optimized: Query fvIfConn directly under the Node.
-            # This avoids traversing the hierarchy and potential missing children issues.
-            
-            try:
-                # Query fvIfConn directly
-                conn_url = f"https://{apic_ip}/api/node/mo/uni/epp/fv-[{epg_dn}]/node-{node}.json?query-target=subtree&target-subtree-class=fvIfConn"
 
-                conn_resp = requests.get(conn_url, headers=headers, verify=False, timeout=10)
-                conn_resp.raise_for_status()
-                conn_data = conn_resp.json()
-                
-                # Normalize interface for matching (Ethernet -> eth)
-                clean_interface = str(interface).strip()
-                norm_interface = clean_interface.replace("Ethernet", "eth")
+            # Heuristic VPC Match: Check if Port Number matches
+            # If the user asks for 'eth1/10' and the path is '..._PolGrp_Port10', strict match fails.
+            # We check if the port number (10) appears as a distinct number in the path suffix.
+            if "protpaths-" in t_dn:
+                try:
+                    # 1. Verify Node ID matches VPC
+                    node_match = False
+                    parts = t_dn.split('/')
+                    for part in parts:
+                        if part.startswith('protpaths-'):
+                            nodes_str = part[10:]
+                            vpc_nodes = nodes_str.split('-')
+                            if str(node) in vpc_nodes:
+                                node_match = True
+                                break
 
-                
-                items = conn_data.get('imdata', [])
+                    if node_match:
+                        # 2. Extract Port Number from Input
+                        # input: eth1/10 -> 10
+                        port_num = None
+                        match = re.search(r'(\d+)$', clean_interface)
+                        if match:
+                            port_num = match.group(1)
 
-                
-                if not items:
-                     return "EPP: No Dynamic Connections", "VMM Domain", "N/A", domains_str
-
-                for item in items:
-                    if 'fvIfConn' in item:
-                        conn_obj = item['fvIfConn']
-                        dn = conn_obj['attributes'].get('dn', '')
-                        
-                        # Check if this fvIfConn is for our interface
-                        # DN format: .../dyatt-[topology/pod-1/paths-215/pathep-[eth1/24]]/conndef/conn-...
-                        
-                        if f"pathep-[{norm_interface}]" in dn:
-
-                             encap = conn_obj['attributes'].get('encap', '')
-                             if encap:
-                                 return encap, "Dynamic (VMM Resolved)", dn, domains_str
-                
+                        if port_num:
+                            # 3. Extract all numbers from the Path Suffix (inside pathep-[...])
+                            # tDn: .../pathep-[Leaf-225-226_PolGrp_Port10]
+                            suffix_match = re.search(r'pathep-\[(.*?)\]', t_dn)
+                            if suffix_match:
+                                suffix_content = suffix_match.group(1)
+                                # Find all distinct numbers in the suffix
+                                path_numbers = re.findall(r'\d+', suffix_content)
 
-                return "EPP: Interface Not Found in Connections", "VMM Domain", "N/A", domains_str
+                                # 4. Check if port_num is in path_numbers
+                                # We compare strings: "10" in ["225", "226", "10"] -> True
+                                if port_num in path_numbers:
+                                    return encap, "VPC", t_dn, domains_str
+                except Exception:
+                    pass
 
-            except Exception as e:
-                print(f"  Error querying Dynamic VLAN: {e}")
-                return f"EPP Error: {str(e)}", "VMM Domain", "N/A", domains_str
+            # Check for Partial Match (Interface matches, but Node doesn't)
+            if target_direct_suffix in t_dn:
+                # Extract the node from the path to show the user
+                found_node = "Unknown"
+                if "paths-" in t_dn:
+                    # .../paths-227/...
+                    try:
+                        found_node = t_dn.split('paths-')[1].split('/')[0]
+                    except: pass
+                elif "protpaths-" in t_dn:
+                    # .../protpaths-225-226/...
+                    try:
+                        found_node = t_dn.split('protpaths-')[1].split('/')[0]
+                    except: pass
+
+                partial_matches.append(f"Node {found_node}")
+
+    # 2. If no static path matched, check if it's a VMM Domain
+    is_vmm = False
+    for item in data.get('imdata', []):
+        if 'fvRsDomAtt' in item:
+            t_dn = item['fvRsDomAtt']['attributes'].get('tDn', '')
+            if 'vmmp-' in t_dn:
+                is_vmm = True
+                break
+
+    if is_vmm:
+        return None, EPP_LOOKUP, None, domains_str
+
+    # 3. If neither, check if we had partial matches
+    if partial_matches:
+        unique_partials = list(set(partial_matches))
+        return "Not Found (Node Mismatch)", "Partial Match", f"Found on: {', '.join(unique_partials)}", domains_str
+
+    return "Not Found", "None", "No matching path", domains_str
 
-        # 3. If neither, check if we had partial matches
-        if partial_matches:
-            unique_partials = list(set(partial_matches))
-            return "Not Found (Node Mismatch)", "Partial Match", f"Found on: {', '.join(unique_partials)}", domains_str
+def match_dynamic_vlan(conn_data, interface, domains_str):
+    """Finds the dynamic VLAN for the interface in the EPP fvIfConn objects of a VMM EPG."""
+    # Normalize interface for matching (Ethernet -> eth)
+    clean_interface = str(interface).strip()
+    norm_interface = clean_interface.replace("Ethernet", "eth")
 
-        return "Not Found", "None", "No matching path", domains_str
+    items = conn_data.get('imdata', [])
+
+    if not items:
+        return "EPP: No Dynamic Connections", "VMM Domain", "N/A", domains_str
+
+    for item in items:
+        if 'fvIfConn' in item:
+            conn_obj = item['fvIfConn']
+            dn = conn_obj['attributes'].get('dn', '')
+
+            # Check if this fvIfConn is for our interface
+            # DN format: .../dyatt-[topology/pod-1/paths-215/pathep-[eth1/24]]/conndef/conn-...
+
+            if f"pathep-[{norm_interface}]" in dn:
+                encap = conn_obj['attributes'].get('encap', '')
+                if encap:
+                    return encap, "Dynamic (VMM Resolved)", dn, domains_str
+
+    return "EPP: Interface Not Found in Connections", "VMM Domain", "N/A", domains_str
+
+def _submit_inline(fn, *args):
+    """Default `submit` hook: runs the stage in the calling thread and returns a finished Future."""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def _match_epg_payload(raw, node, interface):
+    """Decodes one raw EPG reply and matches it (runs in a worker process when pooled)."""
+    return match_epg_vlan(json.loads(raw), node, interface)
+
+def _match_dynamic_payload(raw, interface, domains_str):
+    return match_dynamic_vlan(json.loads(raw), interface, domains_str)
+
+def _start_epg_vlan(apic, submit, epg_dn, node, interface):
+    """Fetches the EPG paths and hands the raw reply to `submit` for matching. Returns a Future."""
+    try:
+        payload = apic.get(_epg_paths_path(epg_dn)).content
+        return submit(_match_epg_payload, payload, node, interface)
+    except Exception as e:
+        future = Future()
+        future.set_exception(e)
+        return future
 
+def _finish_epg_vlan(apic, submit, epg_dn, node, interface, pending):
+    """Waits for the match started by _start_epg_vlan() and resolves VMM EPGs through the EPP."""
+    try:
+        vlan, path_type, path_dn, domains_str = pending.result()
     except Exception as e:
         print(f"Error querying VLAN for {epg_dn}: {e}")
         return "Error", "Error", str(e), ""
 
-def main():
+    if path_type == EPP_LOOKUP:
+        # Attempt to resolve Dynamic VLAN via Endpoint Policy (EPP)
+        try:
+            payload = apic.get(_epp_conn_path(epg_dn, node)).content
+            return submit(_match_dynamic_payload, payload, interface, domains_str).result()
+        except Exception as e:
+            print(f"  Error querying Dynamic VLAN: {e}")
+            return f"EPP Error: {str(e)}", "VMM Domain", "N/A", domains_str
+
+    return vlan, path_type, path_dn, domains_str
+
+def get_epg_vlan(apic, epg_dn, node, interface, submit=_submit_inline):
+    """
+    Queries the EPG for its fvRsPathAtt children and finds the VLAN for the given node/interface.
+    Returns (vlan, path_type, path_dn, domains_str)
+    """
+    pending = _start_epg_vlan(apic, submit, epg_dn, node, interface)
+    return _finish_epg_vlan(apic, submit, epg_dn, node, interface, pending)
+
+def print_run_summary(interface_count, results, stats):
+    """Prints the totals for the run, including retries and circuit breaker trips."""
+    errors = sum(1 for r in results if r.get('VLAN') == "Error")
+    print("\nRun summary:")
+    print(f"  Interfaces processed: {interface_count}")
+    print(f"  EPG rows:             {len(results)}")
+    print(f"  Error rows:           {errors}")
+    print(f"  Retries:              {stats['retries']}")
+    print(f"  Re-logins:            {stats['relogins']}")
+    print(f"  Breaker trips:        {stats['breaker_trips']}")
+    print(f"  Failed requests:      {stats['failed_requests']}")
+    print(f"  Failovers:            {stats['failovers']}")
+    print(f"  APICs dropped:        {stats['members_dropped']}")
+    print(f"  Cache hits:           {stats['cache_hits']}")
+
+def read_interfaces(input_file):
+    """Reads the Node/Interface list from an .xlsx or .csv file. Returns a list of (node, interface)."""
+    if input_file.lower().endswith('.csv'):
+        df_input = pd.read_csv(input_file)
+    else:
+        df_input = pd.read_excel(input_file)
+    return list(zip(df_input['Node'], df_input['Interface']))
+
+def _output_format(output_file, output_format=None):
+    return output_format or os.path.splitext(output_file)[1].lstrip('.').lower() or 'xlsx'
+
+def save_results(results, output_file, output_format=None):
+    """Writes the result rows as xlsx, csv or parquet (taken from the extension if no format is given)."""
+    df_output = pd.DataFrame(results)
+    # Reorder columns - Added PathType and PathDN as requested
+    cols = ['Node', 'Interface', 'Tenant', 'AppProfile', 'EPG', 'VLAN', 'PathType', 'PathDN', 'Domains']
+    # Ensure all columns exist
+    for col in cols:
+        if col not in df_output.columns:
+            df_output[col] = ""
+
+    df_output = df_output[cols]
+    output_format = _output_format(output_file, output_format)
+    if output_format == 'csv':
+        df_output.to_csv(output_file, index=False)
+    elif output_format == 'parquet':
+        df_output.to_parquet(output_file, index=False)
+    else:
+        df_output.to_excel(output_file, index=False)
+
+def discover_interface(apic, node, interface, submit=_submit_inline):
+    """
+    Finds the EPGs deployed on one interface and their VLAN/path details. Returns a list of result rows.
+    The XML parsing and tDn matching go through `submit(fn, *args) -> Future`. By default they run
+    in this thread; pass a ProcessPoolExecutor's submit to run them in worker processes, with
+    only the raw reply bytes crossing over.
+    """
+    results = []
+    print(f"Checking Node {node} Interface {interface}...")
+
+    xml_content = get_epgs_for_interface(apic, node, interface, raw=True)
+
+    if xml_content:
+        try:
+            epgs = submit(parse_epgs, xml_content).result()
+        except Exception as e:
+            print(f"Error parsing EPGs for Node {node} Interface {interface}: {e}")
+            epgs = []
+        if epgs:
+            print(f"  Found {len(epgs)} EPGs. Querying Path Details...")
+            # Start every match as soon as its reply arrives so matching overlaps the next fetch
+            pending = [_start_epg_vlan(apic, submit, epg['DN'], node, interface) for epg in epgs]
+            for epg, match in zip(epgs, pending):
+                epg['Node'] = node
+                epg['Interface'] = interface
+
+                # Query Path Details (VLAN, Type, DN)
+                vlan, path_type, path_dn, domains = _finish_epg_vlan(apic, submit, epg['DN'], node, interface, match)
+                epg['VLAN'] = vlan
+                epg['PathType'] = path_type
+                epg['PathDN'] = path_dn
+                epg['Domains'] = domains
+
+                results.append(epg)
+        else:
+            print(f"  No EPGs found or parsing error.")
+    return results
+
+def _process_pool(processes):
+    # Not fork: the pool starts from inside an I/O thread, and a forked child could inherit
+    # a lock (stdout, stats, urllib3 pools) held by another thread and deadlock on it
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(method))
+
+def _discover_indexed(interfaces, apic, workers, delay, processes=0, ordered=False):
+    """
+    Yields (position, rows) per interface, as they complete or (ordered=True) in input order.
+    At most 2 * workers interfaces are in flight, so the reorder buffer stays small.
+    """
+    # Optional process pool for the CPU-heavy parse/match stages, the threads keep doing the I/O
+    procs = _process_pool(processes) if processes else None
+    submit = procs.submit if procs is not None else _submit_inline
+
+    def task(position, node, interface):
+        rows = discover_interface(apic, node, interface, submit)
+        # Rate limiting to be safe
+        if delay:
+            time.sleep(delay)
+        return position, rows
+
+    workers = max(1, workers)
+    todo = enumerate(interfaces)
+    in_flight = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def submit_next():
+                item = next(todo, None)
+                if item is not None:
+                    position, (node, interface) = item
+                    in_flight.append(pool.submit(task, position, node, interface))
+
+            for _ in range(2 * workers):
+                submit_next()
+            try:
+                while in_flight:
+                    if ordered:
+                        future = in_flight[0]
+                    else:
+                        future = next(iter(wait(in_flight, return_when=FIRST_COMPLETED).done))
+                    result = future.result()
+                    in_flight.remove(future)
+                    submit_next()
+                    yield result
+            finally:
+                # The caller may stop iterating early, don't start the remaining interfaces
+                for future in in_flight:
+                    future.cancel()
+    finally:
+        if procs is not None:
+            procs.shutdown(cancel_futures=True)
+
+def discover(interfaces, apic, workers=4, delay=0.1, processes=0, ordered=False):
+    """
+    Library entry point: queries the EPGs for each (node, interface) pair using `workers` threads.
+    `apic` is a logged-in ApicSession or ApicCluster (optionally wrapped in CachedApic).
+    With processes > 0 the parsing and matching run in that many worker processes.
+    Yields one result row (dict) per EPG, in the order the interfaces complete, or in
+    input order with ordered=True.
+    """
+    for _, rows in _discover_indexed(interfaces, apic, workers, delay, processes, ordered):
+        yield from rows
+
+def read_credentials(credentials_file=None):
+    """
+    Returns (apic_ips, username, password) from a credentials file or the environment.
+    The file uses the same KEY=value names as the environment variables:
+    APIC_HOSTS (comma separated), APIC_USERNAME and APIC_PASSWORD.
+    """
+    values = {}
+    if credentials_file:
+        with open(credentials_file) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    values[key.strip()] = value.strip()
+    for key in ('APIC_HOSTS', 'APIC_USERNAME', 'APIC_PASSWORD'):
+        if key not in values and os.environ.get(key):
+            values[key] = os.environ[key]
+
+    apic_ips = [ip.strip() for ip in values.get('APIC_HOSTS', '').split(',') if ip.strip()]
+    return apic_ips, values.get('APIC_USERNAME'), values.get('APIC_PASSWORD')
+
+def _parse_shard(shard):
+    """Parses 'INDEX/COUNT' (e.g. '0/4'). Raises ValueError unless 0 <= INDEX < COUNT."""
+    index, count = (int(x) for x in shard.split('/'))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard index must be between 0 and {count - 1}")
+    return index, count
+
+def _shard(interfaces, shard):
+    """Keeps every Nth interface for a shard given as 'INDEX/COUNT' (e.g. '0/4')."""
+    index, count = _parse_shard(shard)
+    return [item for position, item in enumerate(interfaces) if position % count == index]
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ACI EPG Discovery Tool")
+    subparsers = parser.add_subparsers(dest='command')
+
+    run = subparsers.add_parser('discover', help="Find the EPGs and VLANs on a list of interfaces (default)")
+    run.add_argument('-i', '--input', default='input_interfaces.xlsx', help="Node/Interface list (.xlsx or .csv)")
+    run.add_argument('-o', '--output', default='output_epgs.xlsx', help="Where to write the results")
+    run.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], help="Output format (default: from the extension)")
+    run.add_argument('--apic', help="APIC IP(s), comma separated (default: APIC_HOSTS)")
+    run.add_argument('--credentials-file', help="File with APIC_HOSTS, APIC_USERNAME and APIC_PASSWORD lines")
+    run.add_argument('--workers', type=int, default=4, help="Concurrent interface queries (default: 4)")
+    run.add_argument('--processes', type=int, default=0, help="Worker processes for parsing/matching, only helps on multi-core hosts (default: 0, in the I/O threads)")
+    run.add_argument('--no-cache', action='store_true', help="Query every EPG again instead of reusing earlier replies")
+    run.add_argument('--cache-size', type=int, default=4096, help="Most EPG/EPP replies kept in the cache (default: 4096)")
+    run.add_argument('--delay', type=float, default=0.1, help="Pause in seconds after each interface (default: 0.1)")
+    run.add_argument('--retries', type=int, default=3, help="Retries per APIC call (default: 3)")
+    run.add_argument('--connect-timeout', type=float, default=3.05, help="Seconds to wait for a connection")
+    run.add_argument('--read-timeout', type=float, default=30, help="Seconds to wait for a reply")
+    run.add_argument('--shard', help="Only process shard INDEX/COUNT of the input (e.g. 0/4) to split a run across processes")
+
+    diff = subparsers.add_parser('diff', help="Compare two discovery runs")
+    aci_epg_diff.add_diff_arguments(diff)
+    return parser
+
+def run_discovery(args):
     print("ACI EPG Discovery Tool")
-    
-    # Configuration
-    input_file = 'input_interfaces.xlsx'
-    output_file = 'output_epgs.xlsx'
-    
-    # Get credentials
-    apic_ip = input("Enter APIC IP: ")
-    username = input("Enter Username: ")
-    password = getpass.getpass("Enter Password: ")
-    
+
+    # Get credentials: command line / credentials file / environment, then prompt for what is missing
+    apic_ips, username, password = read_credentials(args.credentials_file)
+    if args.apic:
+        apic_ips = [ip.strip() for ip in args.apic.split(',') if ip.strip()]
+    if not apic_ips:
+        # Several APICs of the same cluster can be given to spread the queries across them
+        apic_ips = [ip.strip() for ip in input("Enter APIC IP(s), comma separated: ").split(',') if ip.strip()]
+    if not username:
+        username = input("Enter Username: ")
+    if not password:
+        password = getpass.getpass("Enter Password: ")
+
     # Login
     print("Logging in...")
-    token = login_apic(apic_ip, username, password)
-    if not token:
-        return
+    policy = RetryPolicy(max_retries=args.retries, connect_timeout=args.connect_timeout, read_timeout=args.read_timeout)
+    cluster = ApicCluster.from_ips(apic_ips, username, password, policy=policy)
+    if not cluster.login():
+        return 1
+
+    print(f"Login successful ({sum(1 for m in cluster.members if m.token)}/{len(cluster.members)} APICs).")
+    apic = cluster if args.no_cache else CachedApic(cluster, max_entries=args.cache_size)
 
-    print("Login successful.")
-    
     # Read input
     try:
-        df_input = pd.read_excel(input_file)
+        interfaces = read_interfaces(args.input)
     except FileNotFoundError:
-        print(f"Error: {input_file} not found.")
-        return
+        print(f"Error: {args.input} not found.")
+        return 1
+    if args.shard:
+        interfaces = _shard(interfaces, args.shard)
 
+    print(f"Processing {len(interfaces)} interfaces with {args.workers} workers...")
 
-
-    all_results = []
-
-    print(f"Processing {len(df_input)} interfaces...")
-    
-    for index, row in df_input.iterrows():
-        node = row['Node']
-        interface = row['Interface']
-        
-        print(f"Checking Node {node} Interface {interface}...")
-        
-        xml_content = get_epgs_for_interface(apic_ip, token, node, interface)
-        
-        if xml_content:
-            epgs = parse_epgs(xml_content)
-            if epgs:
-                print(f"  Found {len(epgs)} EPGs. Querying Path Details...")
-                for epg in epgs:
-                    epg['Node'] = node
-                    epg['Interface'] = interface
-                    
-                    # Query Path Details (VLAN, Type, DN)
-                    vlan, path_type, path_dn, domains = get_epg_vlan(apic_ip, token, epg['DN'], node, interface)
-                    epg['VLAN'] = vlan
-                    epg['PathType'] = path_type
-                    epg['PathDN'] = path_dn
-                    epg['Domains'] = domains
-                    
-                    all_results.append(epg)
-            else:
-                print(f"  No EPGs found or parsing error.")
-        
-        # Rate limiting to be safe
-        time.sleep(0.1)
+    # Rows stream back in input order
+    all_results = list(discover(interfaces, apic, args.workers, args.delay, args.processes, ordered=True))
 
     # Save results
     if all_results:
-        df_output = pd.DataFrame(all_results)
-        # Reorder columns - Added PathType and PathDN as requested
-        cols = ['Node', 'Interface', 'Tenant', 'AppProfile', 'EPG', 'VLAN', 'PathType', 'PathDN', 'Domains']
-        # Ensure all columns exist
-        for col in cols:
-            if col not in df_output.columns:
-                df_output[col] = ""
-                
-        df_output = df_output[cols]
-        df_output.to_excel(output_file, index=False)
-        print(f"Results saved to {output_file}")
+        save_results(all_results, args.output, args.format)
+        print(f"Results saved to {args.output}")
     else:
         print("No results to save.")
 
+    print_run_summary(len(interfaces), all_results, cluster.stats)
+    return 0
+
+def _check_discover_args(parser, args):
+    """Rejects bad options before logging in, so a long run is not lost at the end."""
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.processes < 0:
+        parser.error("--processes cannot be negative")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
+    if args.shard:
+        try:
+            _parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(f"--shard {args.shard}: expected INDEX/COUNT ({e})")
+    if _output_format(args.output, args.format) == 'parquet':
+        if not aci_epg_diff.has_parquet_engine():
+            parser.error("parquet output needs pyarrow or fastparquet installed")
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'diff':
+        error = aci_epg_diff.check_diff_output(args.output)
+        if error:
+            parser.error(f"--output {args.output}: {error}")
+        return aci_epg_diff.run_diff(args.before, args.after, args.output)
+    if args.command is None:
+        # No subcommand: interactive discovery with the default files
+        args = parser.parse_args(['discover'])
+    _check_discover_args(parser, args)
+    return run_discovery(args)
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Times discover() with and without the process pool on a fake APIC that answers
+instantly, so only the parse/match work is measured:
+
+    python bench_pipeline.py [PROCESSES]
+
+The pool can only pay off with more than one CPU, on a single CPU the workers
+just take turns with the I/O threads, so the bench refuses to run there.
+Measured so far (PROCESSES defaulting to os.cpu_count()):
+
+    1 CPU:  threads only 3.32s / 5.07s, 1 worker process 3.98s / 4.47s
+            (two runs, noise larger than any difference; refused now)
+
+No multi-core measurement has been taken yet, add it here when one is.
+"""
+import json
+import os
+import sys
+import time
+
+import aci_epg_discovery as aci
+from fake_apic import FakeApic
+
+# Synthetic fabric: every interface carries EPGS_PER_INTERFACE EPGs and every EPG
+# has PATHS_PER_EPG static paths, so the parse/match work dominates.
+INTERFACES = 50
+EPGS_PER_INTERFACE = 10
+PATHS_PER_EPG = 2000
+
+def make_fake_apic():
+    """Answers instantly from prebuilt payloads so only the CPU side is measured."""
+    ctx = "".join(f'<pconsResourceCtx ctxClass="fvAEPg" ctxDn="uni/tn-T1/ap-AP1/epg-EPG{i}"/>'
+                  for i in range(EPGS_PER_INTERFACE))
+    interface_xml = f'<?xml version="1.0" encoding="UTF-8"?><imdata>{ctx}</imdata>'.encode()
+    paths = [{"fvRsPathAtt": {"attributes": {
+                 "tDn": f"topology/pod-1/protpaths-{300 + i % 50}-{301 + i % 50}/pathep-[Leaf_PolGrp_Port{i}]",
+                 "encap": f"vlan-{i}"}}}
+             for i in range(PATHS_PER_EPG)]
+    return FakeApic(interface_reply=interface_xml, epg_reply=json.dumps({"imdata": paths}).encode())
+
+def run(processes, workers):
+    interfaces = [(101 + n % 100, f"eth1/{n % 48 + 1}") for n in range(INTERFACES)]
+    start = time.perf_counter()
+    rows = sum(1 for _ in aci.discover(interfaces, make_fake_apic(), workers=workers, delay=0, processes=processes))
+    return time.perf_counter() - start, rows
+
+def main():
+    cpus = os.cpu_count() or 1
+    if cpus < 2:
+        print(f"Only {cpus} CPU here, worker processes cannot run in parallel with the I/O threads. "
+              "Run the benchmark on a multi-core host.")
+        return 1
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else cpus
+    workers = max(4, processes * 2)
+    # Silence the per-interface progress output
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        threaded, rows = run(0, workers)
+        pooled, _ = run(processes, workers)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print(f"{INTERFACES} interfaces, {rows} EPG rows, {PATHS_PER_EPG} paths per EPG")
+    print(f"  Threads only ({workers} workers):       {threaded:.2f}s")
+    print(f"  Threads + {processes} worker processes: {pooled:.2f}s")
+    print(f"  Speedup: {threaded / pooled:.2f}x")
+    if pooled > threaded:
+        print("  The pool was slower, the pickling and start-up cost outweighs the parse/match work here.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
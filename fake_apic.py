@@ -0,0 +1,85 @@
+"""Stand-ins for the APIC shared by the test_*.py files and bench_pipeline.py."""
+import json
+from collections import Counter
+
+import requests
+
+import aci_epg_discovery as aci
+
+INTERFACE_XML = """<?xml version="1.0" encoding="UTF-8"?><imdata totalCount="1">
+<l1PhysIf dn="topology/pod-1/node-{node}/sys/phys-[{interface}]">
+<pconsResourceCtx ctxClass="fvAEPg" ctxDn="uni/tn-T1/ap-AP1/epg-WEB"/>
+</l1PhysIf></imdata>"""
+
+EPG_JSON = json.dumps({"imdata": [
+    {"fvRsPathAtt": {"attributes": {"tDn": "topology/pod-1/paths-225/pathep-[eth1/10]", "encap": "vlan-100"}}},
+    {"fvRsPathAtt": {"attributes": {"tDn": "topology/pod-1/paths-226/pathep-[eth1/11]", "encap": "vlan-101"}}},
+    {"fvRsDomAtt": {"attributes": {"tDn": "uni/phys-PhysDom"}}},
+]}).encode()
+
+class FakeResponse:
+    """The parts of requests.Response the tool uses."""
+    def __init__(self, status_code=200, text="", content=None):
+        self.status_code = status_code
+        self.content = text.encode() if content is None else content
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+class FakeApic:
+    """
+    Stands in for ApicSession/ApicCluster: answers from canned replies and records the paths asked for.
+    By default each interface carries epg-WEB; pass interface_reply/epg_reply (bytes) to answer
+    every interface or EPG query with the same payload.
+    """
+    def __init__(self, interface_reply=None, epg_reply=EPG_JSON):
+        self.stats = Counter()
+        self.paths = []
+        self.interface_reply = interface_reply
+        self.epg_reply = epg_reply
+
+    def get(self, path):
+        self.paths.append(path)
+        if '/sys/phys-[' in path:
+            if self.interface_reply is not None:
+                return FakeResponse(content=self.interface_reply)
+            node = path.split('node-')[1].split('/')[0]
+            interface = path.split('phys-[')[1].split(']')[0]
+            return FakeResponse(text=INTERFACE_XML.format(node=node, interface=interface))
+        return FakeResponse(content=self.epg_reply)
+
+class FakeClock:
+    """Replaces time.monotonic/time.sleep so breaker cooldowns pass instantly."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def make_session(max_retries=3, failure_threshold=5, max_trips=5, cooldown=0):
+    """A logged-in ApicSession with no backoff delay."""
+    stats = Counter()
+    policy = aci.RetryPolicy(max_retries=max_retries, backoff_base=0, jitter=0)
+    breaker = aci.CircuitBreaker(failure_threshold=failure_threshold, cooldown=cooldown, max_trips=max_trips, stats=stats)
+    session = aci.ApicSession("10.0.0.1", "admin", "pw", policy=policy, breaker=breaker, stats=stats)
+    session.token = "tok-1"
+    return session
+
+def make_cluster(ips, max_retries=0):
+    """A logged-in ApicCluster built the way the CLI builds it, with no backoff delay."""
+    policy = aci.RetryPolicy(max_retries=max_retries, backoff_base=0, jitter=0)
+    cluster = aci.ApicCluster.from_ips(ips, "admin", "pw", policy=policy)
+    for member in cluster.members:
+        member.token = f"tok-{member.apic_ip}"
+    return cluster
@@ -0,0 +1,118 @@
+import time
+from collections import Counter
+from unittest import mock
+
+import requests
+
+import aci_epg_discovery as aci
+from fake_apic import FakeResponse, make_cluster
+
+def host_of(url):
+    return url.split('/')[2]
+
+def test_spreads_by_latency():
+    print("Testing latency-weighted selection...")
+    cluster = make_cluster(["apic1", "apic2", "apic3"])
+    cluster._latency.update({"apic1": 0.5, "apic2": 0.1, "apic3": 0.3})
+    hosts = []
+
+    def fake_get(url, **kwargs):
+        hosts.append(host_of(url))
+        return FakeResponse(200, "ok")
+
+    with mock.patch.object(aci.requests, "get", side_effect=fake_get):
+        cluster.get("/api/class/fvTenant.json")
+    assert hosts == ["apic2"]
+
+def test_least_outstanding():
+    print("Testing least-outstanding selection...")
+    cluster = make_cluster(["apic1", "apic2"])
+    cluster._latency.update({"apic1": 0.1, "apic2": 0.1})
+    cluster._outstanding["apic1"] = 4
+    member = cluster._pick(set())
+    assert member.apic_ip == "apic2"
+    assert cluster._outstanding["apic2"] == 1
+
+def test_fresh_members_spread():
+    print("Testing unmeasured members are spread by outstanding requests...")
+    cluster = make_cluster(["a", "b", "c"])
+    picked = Counter(cluster._pick(set()).apic_ip for _ in range(4))
+    assert sorted(picked.values()) == [1, 1, 2]
+
+def test_health_check_relogs_in_once():
+    print("Testing health check re-login is limited to one per probe...")
+    cluster = make_cluster(["apic1", "apic2"])
+    member = cluster.members[0]
+    with mock.patch.object(aci.requests, "get", return_value=FakeResponse(403)) as fake_get, \
+         mock.patch.object(aci, "login_apic", return_value="tok-new") as fake_login:
+        assert not cluster.health_check(member)
+    assert fake_login.call_count == 1
+    assert fake_get.call_count == 2
+
+def test_failover_drops_member():
+    print("Testing failover to another member...")
+    cluster = make_cluster(["apic1", "apic2"])
+    cluster._latency.update({"apic1": 0.1, "apic2": 0.2})
+
+    def fake_get(url, **kwargs):
+        if host_of(url) == "apic1":
+            raise requests.ConnectionError("refused")
+        return FakeResponse(200, "ok")
+
+    with mock.patch.object(aci.requests, "get", side_effect=fake_get):
+        response = cluster.get("/api/class/fvTenant.json")
+
+    assert response.text == "ok"
+    assert cluster.stats['failovers'] == 1
+    assert cluster.stats['members_dropped'] == 1
+    assert [m.apic_ip for m in cluster.members if m.apic_ip not in cluster._down_until] == ["apic2"]
+
+def test_failover_does_not_wait_for_cooldown():
+    print("Testing an open member breaker fails over without waiting...")
+    # Enough retries that apic1's breaker (5 failures, 30s cooldown) opens mid-request
+    cluster = make_cluster(["apic1", "apic2"], max_retries=10)
+    cluster._latency.update({"apic1": 0.1, "apic2": 0.2})
+
+    def fake_get(url, **kwargs):
+        if host_of(url) == "apic1":
+            raise requests.ConnectionError("refused")
+        return FakeResponse(200, "ok")
+
+    start = time.monotonic()
+    with mock.patch.object(aci.requests, "get", side_effect=fake_get):
+        response = cluster.get("/api/class/fvTenant.json")
+    assert time.monotonic() - start < 1.0
+    assert response.text == "ok"
+    assert cluster.members[0].breaker.tripped
+    assert cluster.stats['failovers'] == 1
+
+def test_client_error_not_failed_over():
+    print("Testing 404 is not failed over...")
+    cluster = make_cluster(["apic1", "apic2"])
+    with mock.patch.object(aci.requests, "get", return_value=FakeResponse(404)) as fake_get:
+        try:
+            cluster.get("/api/mo/uni/tn-missing.json")
+            assert False, "expected HTTPError"
+        except requests.HTTPError:
+            pass
+    assert fake_get.call_count == 1
+    assert cluster.stats['members_dropped'] == 0
+
+def test_health_check_restores_member():
+    print("Testing health check brings a member back...")
+    cluster = make_cluster(["apic1", "apic2"])
+    cluster._down_until["apic1"] = 0.001
+    with mock.patch.object(aci.requests, "get", return_value=FakeResponse(200, "ok")):
+        cluster.get("/api/class/fvTenant.json")
+    assert "apic1" not in cluster._down_until
+
+if __name__ == "__main__":
+    test_spreads_by_latency()
+    test_least_outstanding()
+    test_fresh_members_spread()
+    test_health_check_relogs_in_once()
+    test_failover_drops_member()
+    test_failover_does_not_wait_for_cooldown()
+    test_client_error_not_failed_over()
+    test_health_check_restores_member()
+    print("All tests passed!")
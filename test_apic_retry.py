@@ -0,0 +1,120 @@
+from collections import Counter
+from unittest import mock
+
+import requests
+
+import aci_epg_discovery as aci
+from fake_apic import FakeClock, FakeResponse, make_session
+
+def test_retry_then_success():
+    print("Testing retry on transient errors...")
+    session = make_session()
+    replies = [requests.Timeout("read timed out"), FakeResponse(503), FakeResponse(200, "ok")]
+
+    def fake_get(url, **kwargs):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    with mock.patch.object(aci.requests, "get", side_effect=fake_get), mock.patch.object(aci.time, "sleep"):
+        response = session.get("/api/class/fvTenant.json")
+
+    assert response.text == "ok"
+    assert session.stats['retries'] == 2
+    assert session.stats['failed_requests'] == 0
+
+def test_retries_exhausted():
+    print("Testing retries exhausted...")
+    session = make_session(max_retries=2)
+    with mock.patch.object(aci.requests, "get", return_value=FakeResponse(500)), mock.patch.object(aci.time, "sleep"):
+        try:
+            session.get("/api/class/fvTenant.json")
+            assert False, "expected HTTPError"
+        except requests.HTTPError:
+            pass
+    assert session.stats['retries'] == 2
+    assert session.stats['failed_requests'] == 1
+
+def test_relogin_on_403():
+    print("Testing re-login on expired token...")
+    session = make_session()
+    seen_cookies = []
+
+    def fake_get(url, headers=None, **kwargs):
+        seen_cookies.append(headers["Cookie"])
+        return FakeResponse(403) if len(seen_cookies) == 1 else FakeResponse(200, "ok")
+
+    with mock.patch.object(aci.requests, "get", side_effect=fake_get), \
+         mock.patch.object(aci, "login_apic", return_value="tok-2"):
+        response = session.get("/api/class/fvTenant.json")
+
+    assert response.text == "ok"
+    assert seen_cookies == ["APIC-cookie=tok-1", "APIC-cookie=tok-2"]
+    assert session.stats['relogins'] == 1
+
+def test_breaker_trips_and_gives_up():
+    print("Testing circuit breaker...")
+    session = make_session(max_retries=10, failure_threshold=2, max_trips=1, cooldown=30)
+    clock = FakeClock()
+    with mock.patch.object(aci.requests, "get", side_effect=requests.ConnectionError("refused")), \
+         mock.patch.object(aci.time, "sleep", side_effect=clock.sleep), \
+         mock.patch.object(aci.time, "monotonic", side_effect=clock.monotonic):
+        try:
+            session.get("/api/class/fvTenant.json")
+            assert False, "expected CircuitOpenError"
+        except aci.CircuitOpenError:
+            pass
+    # Tripped once, the half-open probe failed and tripped it again
+    assert session.stats['breaker_trips'] == 2
+
+def test_breaker_recovers_after_probe():
+    print("Testing circuit breaker closes again after a good probe...")
+    session = make_session(max_retries=10, failure_threshold=2, max_trips=1, cooldown=30)
+    clock = FakeClock()
+    replies = [requests.ConnectionError("refused")] * 2 + [FakeResponse(200, "ok")]
+
+    def fake_get(url, **kwargs):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    with mock.patch.object(aci.requests, "get", side_effect=fake_get), \
+         mock.patch.object(aci.time, "sleep", side_effect=clock.sleep), \
+         mock.patch.object(aci.time, "monotonic", side_effect=clock.monotonic):
+        response = session.get("/api/class/fvTenant.json")
+
+    assert response.text == "ok"
+    assert session.stats['breaker_trips'] == 1
+    assert session.breaker.trips == 0
+    assert not session.breaker.tripped
+
+def test_login_retries():
+    print("Testing login retries transient failures...")
+    replies = [requests.ConnectionError("refused"),
+               FakeResponse(503),
+               FakeResponse(200)]
+    replies[-1].json = lambda: {"imdata": [{"aaaLogin": {"attributes": {"token": "tok-9"}}}]}
+    stats = Counter()
+    policy = aci.RetryPolicy(max_retries=3, backoff_base=0, jitter=0)
+
+    def fake_post(url, **kwargs):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    with mock.patch.object(aci.requests, "post", side_effect=fake_post), mock.patch.object(aci.time, "sleep"):
+        token = aci.login_apic("10.0.0.1", "admin", "pw", policy, stats)
+    assert token == "tok-9"
+    assert stats['retries'] == 2
+
+if __name__ == "__main__":
+    test_retry_then_success()
+    test_retries_exhausted()
+    test_relogin_on_403()
+    test_breaker_trips_and_gives_up()
+    test_breaker_recovers_after_probe()
+    test_login_retries()
+    print("All tests passed!")
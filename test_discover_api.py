@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from collections import Counter
+from unittest import mock
+
+import aci_epg_discovery as aci
+from fake_apic import FakeApic
+
+def test_discover_yields_rows():
+    print("Testing discover() API...")
+    apic = FakeApic()
+    rows = list(aci.discover([(225, 'eth1/10'), (226, 'eth1/11')], aci.CachedApic(apic), workers=2, delay=0))
+
+    by_node = {row['Node']: row for row in rows}
+    assert set(by_node) == {225, 226}
+    assert by_node[225]['VLAN'] == "vlan-100"
+    assert by_node[226]['VLAN'] == "vlan-101"
+    assert by_node[226]['EPG'] == "WEB"
+    assert by_node[226]['Domains'] == "PhysDom"
+
+    # Both interfaces carry the same EPG, the cache sends its query once
+    assert sum(1 for p in apic.paths if 'epg-WEB.json' in p) == 1
+    assert apic.stats['cache_hits'] == 1
+
+def test_cache_single_flight():
+    print("Testing concurrent misses send one request...")
+    apic = FakeApic()
+    slow_get = apic.get
+
+    def get(path):
+        time.sleep(0.05)
+        return slow_get(path)
+    apic.get = get
+    cache = aci.CachedApic(apic)
+    epg_path = "/api/node/mo/uni/tn-T1/ap-AP1/epg-WEB.json"
+
+    threads = [threading.Thread(target=cache.get, args=(epg_path,)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert apic.paths.count(epg_path) == 1
+    assert apic.stats['cache_hits'] == 3
+
+    # Per-interface queries are never repeated, so they are not kept
+    interface_path = "/api/node/mo/topology/pod-1/node-225/sys/phys-[eth1/10].xml"
+    cache.get(interface_path)
+    cache.get(interface_path)
+    assert apic.paths.count(interface_path) == 2
+
+def test_cache_failure_is_not_a_hit():
+    print("Testing waiters on a failed request are not counted as cache hits...")
+    apic = FakeApic()
+    started = threading.Event()
+
+    def get(path):
+        started.set()
+        time.sleep(0.05)
+        raise aci.requests.ConnectionError("refused")
+    apic.get = get
+    cache = aci.CachedApic(apic)
+    errors = []
+
+    def fetch():
+        try:
+            cache.get("/api/node/mo/uni/tn-T1/ap-AP1/epg-WEB.json")
+        except aci.requests.ConnectionError as e:
+            errors.append(e)
+    owner = threading.Thread(target=fetch)
+    owner.start()
+    started.wait()
+    waiter = threading.Thread(target=fetch)
+    waiter.start()
+    owner.join()
+    waiter.join()
+    assert len(errors) == 2
+    assert apic.stats['cache_hits'] == 0
+
+def test_cache_keeps_recent_entries():
+    print("Testing the cache drops the least recently used reply...")
+    apic = FakeApic()
+    cache = aci.CachedApic(apic, max_entries=2)
+    web, app, db = (f"/api/node/mo/uni/tn-T1/ap-AP1/epg-{name}.json" for name in ("WEB", "APP", "DB"))
+    cache.get(web)
+    cache.get(app)
+    cache.get(web)
+    # APP is the least recently used and makes room for DB
+    cache.get(db)
+    cache.get(web)
+    cache.get(app)
+    assert apic.paths.count(web) == 1
+    assert apic.paths.count(app) == 2
+    assert apic.stats['cache_hits'] == 2
+
+def test_discover_arg_checks():
+    print("Testing bad options are rejected before login...")
+    for argv in (['discover', '--shard', '0/0'], ['discover', '--shard', '4/4'], ['discover', '--shard', 'x'],
+                 ['discover', '--cache-size', '0'], ['discover', '--workers', '0'],
+                 ['discover', '--processes', '-1']):
+        try:
+            aci.main(argv)
+            assert False, f"expected {argv} to be rejected"
+        except SystemExit as e:
+            assert e.code == 2
+    with mock.patch.object(aci.aci_epg_diff, "has_parquet_engine", return_value=False), \
+         mock.patch.object(aci, "run_discovery") as run:
+        try:
+            aci.main(['discover', '-o', 'out.parquet'])
+            assert False, "expected parquet without pyarrow to be rejected"
+        except SystemExit as e:
+            assert e.code == 2
+    assert not run.called
+
+def test_process_pool_matches_threads():
+    print("Testing process pool pipeline gives the same rows...")
+    interfaces = [(225, 'eth1/10'), (226, 'eth1/11'), (227, 'eth1/12')]
+    threaded = list(aci.discover(interfaces, FakeApic(), workers=2, delay=0))
+    pooled = list(aci.discover(interfaces, FakeApic(), workers=2, delay=0, processes=2))
+
+    def key(row):
+        return row['Node'], row['DN']
+    assert sorted(threaded, key=key) == sorted(pooled, key=key)
+    assert {row['VLAN'] for row in pooled} == {"vlan-100", "vlan-101", "Not Found"}
+
+def test_ordered_streaming():
+    print("Testing ordered results with a bounded window...")
+    apic = FakeApic()
+    slow_get = apic.get
+
+    def get(path):
+        # Early interfaces answer slowest, so completion order is the reverse of input order
+        if '/sys/phys-[' in path:
+            time.sleep(0.02 * (235 - int(path.split('node-')[1].split('/')[0])))
+        return slow_get(path)
+    apic.get = get
+
+    interfaces = [(node, 'eth1/10') for node in range(225, 235)]
+    rows = list(aci.discover(interfaces, apic, workers=3, delay=0, ordered=True))
+    assert [row['Node'] for row in rows] == list(range(225, 235))
+
+def test_pool_failure_gives_error_rows():
+    print("Testing a failing parse/match stage turns into Error rows...")
+    from concurrent.futures.process import BrokenProcessPool
+
+    def broken_match(fn, *args):
+        if fn is aci.parse_epgs:
+            return aci._submit_inline(fn, *args)
+        raise BrokenProcessPool("worker died")
+
+    rows = aci.discover_interface(FakeApic(), 225, 'eth1/10', broken_match)
+    assert len(rows) == 1
+    assert rows[0]['VLAN'] == "Error"
+    assert "worker died" in rows[0]['PathDN']
+
+    def broken_parse(fn, *args):
+        raise BrokenProcessPool("worker died")
+    assert aci.discover_interface(FakeApic(), 225, 'eth1/10', broken_parse) == []
+
+def test_read_credentials():
+    print("Testing credentials from file and environment...")
+    creds_file = 'test_credentials.env'
+    with open(creds_file, 'w') as f:
+        f.write("# lab fabric\nAPIC_HOSTS=10.0.0.1, 10.0.0.2\nAPIC_USERNAME=admin\n")
+    try:
+        with mock.patch.dict(os.environ, {"APIC_PASSWORD": "secret", "APIC_USERNAME": "other"}):
+            apic_ips, username, password = aci.read_credentials(creds_file)
+    finally:
+        os.remove(creds_file)
+    assert apic_ips == ["10.0.0.1", "10.0.0.2"]
+    # The file wins over the environment
+    assert username == "admin"
+    assert password == "secret"
+
+def test_shard():
+    interfaces = [(n, 'eth1/1') for n in range(10)]
+    shards = [aci._shard(interfaces, f"{i}/3") for i in range(3)]
+    assert sorted(sum(shards, [])) == interfaces
+    assert shards[1] == [(1, 'eth1/1'), (4, 'eth1/1'), (7, 'eth1/1')]
+
+if __name__ == "__main__":
+    test_discover_yields_rows()
+    test_cache_single_flight()
+    test_cache_failure_is_not_a_hit()
+    test_cache_keeps_recent_entries()
+    test_discover_arg_checks()
+    test_process_pool_matches_threads()
+    test_ordered_streaming()
+    test_pool_failure_gives_error_rows()
+    test_read_credentials()
+    test_shard()
+    print("All tests passed!")
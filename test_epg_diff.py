@@ -0,0 +1,111 @@
+import argparse
+import os
+from unittest import mock
+
+import pandas as pd
+
+import aci_epg_diff
+from aci_epg_diff import check_diff_output, diff_files, diff_runs, load_run, save_diff
+
+COLS = ['Node', 'Interface', 'Tenant', 'AppProfile', 'EPG', 'VLAN', 'PathType', 'PathDN', 'Domains']
+
+def make_run(rows):
+    return pd.DataFrame(rows, columns=COLS)
+
+def test_diff_runs():
+    print("Testing run diff...")
+    before_file = 'test_diff_before.csv'
+    after_file = 'test_diff_after.csv'
+
+    try:
+        make_run([
+            [225, 'eth1/10', 'T1', 'AP1', 'WEB', 'vlan-100', 'Direct', 'topology/pod-1/paths-225/pathep-[eth1/10]', 'phys'],
+            [225, 'eth1/10', 'T1', 'AP1', 'APP', 'vlan-200', 'Direct', 'topology/pod-1/paths-225/pathep-[eth1/10]', 'phys'],
+            [226, 'eth1/11', 'T1', 'AP1', 'DB', 'vlan-300', 'Direct', 'topology/pod-1/paths-226/pathep-[eth1/11]', 'phys'],
+        ]).to_csv(before_file, index=False)
+        make_run([
+            ['225', 'eth1/10 ', 'T1', 'AP1', 'WEB', 'vlan-100', 'Direct', 'topology/pod-1/paths-225/pathep-[eth1/10]', 'phys'],
+            ['225', 'eth1/10', 'T1', 'AP1', 'APP', 'vlan-201', 'Direct', 'topology/pod-1/paths-225/pathep-[eth1/10]', 'phys'],
+            ['227', 'eth1/12', 'T1', 'AP1', 'NEW', 'vlan-400', 'Direct', 'topology/pod-1/paths-227/pathep-[eth1/12]', 'phys'],
+        ]).to_csv(after_file, index=False)
+
+        diff = diff_runs(load_run(before_file), load_run(after_file))
+    finally:
+        for path in (before_file, after_file):
+            if os.path.exists(path):
+                os.remove(path)
+    print(diff[['Change', 'Node', 'Interface', 'EPG', 'ChangedFields']])
+
+    changes = {(r.Change, r.Node, r.EPG) for r in diff.itertuples()}
+    assert changes == {
+        ("Added", "227", "NEW"),
+        ("Removed", "226", "DB"),
+        ("Changed", "225", "APP"),
+    }
+    changed = diff[diff['Change'] == "Changed"].iloc[0]
+    assert changed['ChangedFields'] == "VLAN"
+    assert changed['VLAN_before'] == "vlan-200"
+    assert changed['VLAN_after'] == "vlan-201"
+    assert changed['DN'] == "uni/tn-T1/ap-AP1/epg-APP"
+
+def test_parquet_missing_values():
+    print("Testing Parquet missing values load as empty strings...")
+    stored = make_run([['225', 'eth1/10', 'T1', 'AP1', 'WEB', 'vlan-100', 'Direct', None, None]])
+    with mock.patch.object(pd, "read_parquet", return_value=stored):
+        df = load_run('run.parquet')
+    assert df.loc[0, 'PathDN'] == ""
+    assert df.loc[0, 'Domains'] == ""
+
+def test_partitioned_diff_matches():
+    print("Testing partitioned diff gives the same result as the in-memory diff...")
+    before_file = 'test_diff_before.csv'
+    after_file = 'test_diff_after.csv'
+    rows = [[200 + n % 40, f'eth1/{n % 48 + 1}', 'T1', 'AP1', f'EPG{n}', f'vlan-{n}', 'Direct', '', 'phys']
+            for n in range(500)]
+    changed = [row[:5] + [f'vlan-{row[5][5:]}0'] + row[6:] if n % 7 == 0 else row for n, row in enumerate(rows)]
+    try:
+        make_run(rows[:450]).to_csv(before_file, index=False)
+        make_run(changed[50:]).to_csv(after_file, index=False)
+        whole = diff_runs(load_run(before_file), load_run(after_file))
+        # Small chunks so every partition is appended to several times
+        partitioned = diff_files(before_file, after_file, partitions=7, chunksize=64)
+    finally:
+        for path in (before_file, after_file):
+            if os.path.exists(path):
+                os.remove(path)
+    assert set(whole['Change']) == {"Added", "Removed", "Changed"}
+    pd.testing.assert_frame_equal(partitioned, whole)
+
+def test_diff_output_checks():
+    print("Testing diff output is checked before any work...")
+    assert check_diff_output('diff.csv') is None
+    assert "use .xlsx, .csv or .parquet" in check_diff_output('diff.txt')
+    with mock.patch.object(aci_epg_diff, "has_parquet_engine", return_value=False):
+        assert "pyarrow" in check_diff_output('diff.parquet')
+
+    diff = pd.DataFrame({'Change': ["Added"] * 3})
+    with mock.patch.object(aci_epg_diff, "XLSX_MAX_ROWS", 2), \
+         mock.patch.object(pd.DataFrame, "to_excel") as to_excel:
+        try:
+            save_diff(diff, 'diff.xlsx')
+            assert False, "expected too many rows for Excel to be rejected"
+        except ValueError as e:
+            assert ".csv or .parquet" in str(e)
+    assert not to_excel.called
+
+def test_diff_arguments_shared():
+    print("Testing the diff script and subcommand take the same arguments...")
+    import aci_epg_discovery
+    parser = argparse.ArgumentParser()
+    aci_epg_diff.add_diff_arguments(parser)
+    standalone = parser.parse_args(['a.csv', 'b.csv', '-o', 'd.csv'])
+    subcommand = aci_epg_discovery.build_parser().parse_args(['diff', 'a.csv', 'b.csv', '-o', 'd.csv'])
+    assert vars(standalone) == {k: v for k, v in vars(subcommand).items() if k != 'command'}
+
+if __name__ == "__main__":
+    test_diff_runs()
+    test_parquet_missing_values()
+    test_partitioned_diff_matches()
+    test_diff_output_checks()
+    test_diff_arguments_shared()
+    print("All tests passed!")